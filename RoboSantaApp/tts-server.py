@@ -1,17 +1,33 @@
+import asyncio
+import atexit
+import collections
+import concurrent.futures
 import contextlib
-import io
+import functools
+import hashlib
 import json
 import logging
 import os
+import queue
 import re
+import shutil
+import struct
 import sys
+import threading
+import time
 import unicodedata
 import uuid
 import warnings
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+# Small-batch CPU inference collapses when BLAS spins up one thread per core;
+# pin a small thread count before torch is imported. Override with TTS_NUM_THREADS.
+NUM_THREADS = max(int(os.environ.get("TTS_NUM_THREADS", "1")), 1)
+for key in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+    os.environ.setdefault(key, str(NUM_THREADS))
 
 import torch
-import torch.nn.functional as F 
 import torchaudio as ta
 
 # Ensure the server stays offline-friendly even if corporate proxy env vars leak in.
@@ -38,17 +54,74 @@ warnings.filterwarnings(
 )
 logging.getLogger("chatterbox").setLevel(logging.ERROR)
 
+# Reduced-memory mode: keep the T3 and S3Gen flow weights in float16 on MPS,
+# and memory-map checkpoints so loading doesn't hold a second full copy of
+# each file in memory (load_state_dict still reads every tensor once).
+# Opt in with TTS_FP16=1.
+USE_FP16 = os.environ.get("TTS_FP16", "0") == "1"
+
 # Force CPU mapping for any torch.load inside the library
 _real_torch_load = torch.load
 
 
 def _torch_load_cpu(*args, **kw):
     kw.setdefault("map_location", "cpu")
+    if USE_FP16 and "mmap" not in kw:
+        try:
+            return _real_torch_load(*args, mmap=True, **kw)
+        except (RuntimeError, TypeError, ValueError):
+            # Legacy (non-zipfile) checkpoints and file objects can't be mmapped
+            pass
     return _real_torch_load(*args, **kw)
 
 
 torch.load = _torch_load_cpu
 
+torch.set_num_threads(NUM_THREADS)
+torch.set_num_interop_threads(NUM_THREADS)
+
+# Pure inference server: never track autograd history. Grad mode is
+# per-thread, so this covers model loading and voice prefetch on the main
+# thread; _worker() disables it again for generation.
+torch.set_grad_enabled(False)
+
+# Reduced-precision autocast for generation (bfloat16, or float16 to match
+# TTS_FP16 weights); set TTS_BF16=0 if a Chatterbox submodule misbehaves.
+# Also switched off automatically if the first generation fails.
+_use_autocast = USE_FP16 or os.environ.get("TTS_BF16", "1") == "1"
+_autocast_dtype = torch.float16 if USE_FP16 else torch.bfloat16
+_generate_succeeded = False
+
+
+def _trim_bounds(wav: torch.Tensor, window: int) -> "tuple[int, int] | None":
+    """Return the first/last envelope indices above ~4% of the envelope peak.
+
+    The envelope is a centered moving sum of the mono peak magnitude, built in
+    one preallocated buffer that the running sum is written into directly, with
+    no padded copy of the signal. Comparing window sums against a scaled
+    threshold avoids dividing by the window. Returns None if nothing is active.
+    """
+    magnitude = wav.abs().amax(dim=0)
+    pad = window // 2
+    count = magnitude.shape[0] + 2 * pad + 1 - window
+
+    # csum[0] = 0, csum[pad + 1 : pad + 1 + n] = running sum, right padding repeats the total
+    csum = magnitude.new_zeros(magnitude.shape[0] + 2 * pad + 1)
+    torch.cumsum(magnitude, 0, out=csum[pad + 1 : pad + 1 + magnitude.shape[0]])
+    csum[pad + 1 + magnitude.shape[0] :] = csum[pad + magnitude.shape[0]]
+    envelope = csum[window : window + count] - csum[:count]
+
+    peak = float(envelope.max())
+    if peak <= 0:
+        return None
+
+    active = envelope >= max(peak * 0.04, 1e-4 * window)
+    first = int(active.byte().argmax())
+    if not active[first]:
+        return None
+    last = count - 1 - int(active.flip(0).byte().argmax())
+    return first, last
+
 
 def _trim_wav(wav: torch.Tensor, sample_rate: int) -> torch.Tensor:
     """Remove leading/trailing near-silence from a waveform.
@@ -61,24 +134,11 @@ def _trim_wav(wav: torch.Tensor, sample_rate: int) -> torch.Tensor:
     if wav.numel() == 0:
         return wav
 
-    # Collapse to a mono envelope and smooth with a short average window
-    magnitude = wav.abs().max(dim=0).values
     window = max(int(sample_rate * 0.03), 1)  # ~30ms
-    kernel = torch.ones(1, 1, window, device=wav.device) / window
-    envelope = F.conv1d(magnitude.view(1, 1, -1), kernel, padding=window // 2).squeeze()
-
-    peak = envelope.max()
-    if peak <= 0:
-        return wav
-
-    threshold = max(peak * 0.04, 1e-4)  # Require ~4% of envelope peak
-    active = envelope >= threshold
-    if not torch.any(active):
+    bounds = _trim_bounds(wav, window)
+    if bounds is None:
         return wav
-
-    indices = torch.nonzero(active, as_tuple=False).flatten()
-    start = int(indices[0].item())
-    end = int(indices[-1].item())
+    start, end = bounds
 
     guard = int(sample_rate * 0.03)
     start = max(0, start - guard)
@@ -90,19 +150,108 @@ def _trim_wav(wav: torch.Tensor, sample_rate: int) -> torch.Tensor:
     return wav[:, start : end + 1]
 
 
+class _DevNull:
+    """Write sink used to silence noisy library output during startup."""
+
+    def write(self, _):
+        return 0
+
+    def flush(self):
+        pass
+
+
+_DEVNULL = _DevNull()
+
+_tts_lock = threading.Lock()
+_tts_instance = None
+
+
 def _load_tts():
-    stdout_buf, stderr_buf = io.StringIO(), io.StringIO()
-    with contextlib.redirect_stdout(stdout_buf), contextlib.redirect_stderr(stderr_buf), warnings.catch_warnings():
-        warnings.filterwarnings(
-            "ignore",
-            r"pkg_resources is deprecated.*",
-            category=UserWarning,
-            module=r"perth\.perth_net",
-        )
-        from chatterbox.mtl_tts import ChatterboxMultilingualTTS
+    """Load the Chatterbox model once and keep it resident for the process lifetime.
+
+    Guarded by a lock so concurrent callers can never trigger a second
+    (multi-second) model initialization.
+    """
+    global _tts_instance, _weight_dtype
+    with _tts_lock:
+        if _tts_instance is not None:
+            return _tts_instance
+
+        with contextlib.redirect_stdout(_DEVNULL), contextlib.redirect_stderr(_DEVNULL):
+            from chatterbox.mtl_tts import ChatterboxMultilingualTTS
+
+            device = "mps" if torch.backends.mps.is_available() else "cpu"
+            _tts_instance = ChatterboxMultilingualTTS.from_pretrained(device=torch.device(device))
+            if USE_FP16 and device == "mps":
+                _weight_dtype = torch.float16
+                _set_weight_dtype(_tts_instance, _weight_dtype)
+            if USE_COMPILE:
+                _compile_hot_modules(_tts_instance)
+        return _tts_instance
+
+
+# dtype of the T3 and S3Gen flow weights; float16 only with TTS_FP16 on MPS.
+_weight_dtype = torch.float32
+
+
+def _set_weight_dtype(model, dtype: torch.dtype) -> None:
+    """Cast the T3 and S3Gen flow weights.
+
+    The S3 tokenizer, speaker encoders and vocoder stay in float32: the
+    tokenizer multiplies its float32 mel filters with the input, so casting
+    all of S3Gen would break voice conditioning.
+    """
+    for module in [model.t3, model.s3gen.flow]:
+        module.to(dtype=dtype)
 
-        device = "mps" if torch.backends.mps.is_available() else "cpu"
-        return ChatterboxMultilingualTTS.from_pretrained(device=torch.device(device))
+
+# torch.compile the flow-matching hot loop. Compilation makes the first
+# generation slow, so set TTS_COMPILE=0 for faster cold starts.
+USE_COMPILE = os.environ.get("TTS_COMPILE", "1") == "1"
+WARMUP_VOICE = "alfons1"
+
+# Modules whose forward was replaced by a compiled one; emptied on revert.
+_compiled_modules: "list[torch.nn.Module]" = []
+
+
+def _compile_hot_modules(model) -> None:
+    """Compile the flow-matching estimator's forward in place.
+
+    S3Gen calls estimator.forward(...) directly once per ODE step, bypassing
+    __call__, so the bound forward itself is replaced rather than using
+    nn.Module.compile(). The T3 transformer is left eager: the multilingual
+    model registers a fresh attention hook on it for every inference() call.
+    torch.compile is lazy, so failures only surface on the first generate();
+    _generate() reverts to eager via _revert_compiled() when that happens.
+    """
+    module = model
+    for attr in ["s3gen", "flow", "decoder", "estimator"]:
+        module = getattr(module, attr, None)
+    if isinstance(module, torch.nn.Module):
+        module.forward = torch.compile(module.forward, mode="reduce-overhead", fullgraph=False)
+        _compiled_modules.append(module)
+
+
+def _revert_compiled() -> None:
+    """Restore the eager forward of every compiled module."""
+    for module in _compiled_modules:
+        del module.forward  # drop the instance override, exposing the class method
+    _compiled_modules.clear()
+
+
+def _is_compile_error(exc: BaseException) -> bool:
+    """True for dynamo/inductor failures (BackendCompilerFailed included)."""
+    try:
+        from torch._dynamo.exc import TorchDynamoException
+    except ImportError:
+        return False
+    return isinstance(exc, TorchDynamoException)
+
+
+def _log_warmup_failure(future: concurrent.futures.Future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        print(f"Warmup generation failed: {exc}", file=sys.stderr)
 
 
 tts = _load_tts()
@@ -111,6 +260,37 @@ tts = _load_tts()
 # Directory for temporary WAV files
 TEMP_DIR = "/tmp/tts-server"
 
+# Rendered files that are never fetched get swept after this long. Clients may
+# render a whole batch before downloading it, so keep this generous.
+TEMP_FILE_MAX_AGE_SECONDS = 30 * 60
+JANITOR_INTERVAL_SECONDS = 60
+
+# Renders shared between identical (voice, text) requests. Each response gets
+# its own hard link in TEMP_DIR, so GET can delete it without touching the cache.
+RENDER_CACHE_DIR = os.path.join(TEMP_DIR, "cache")
+RENDER_CACHE_SIZE = 64
+_render_lock = threading.Lock()
+_inflight: "dict[str, concurrent.futures.Future]" = {}
+_rendered: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+
+# Upper bound on request text to keep a single synthesis from running away
+MAX_TEXT_CHARS = 2000
+
+# Emotion exaggeration baked into cached voice conditionals. generate() is
+# passed the value read back from the conds (see _generate), because comparing
+# the Python float 0.1 against the stored float32 never matches and Chatterbox
+# would rebuild conds.t3 on every call.
+EXAGGERATION = 0.1
+
+# Pending synthesis jobs; a single worker thread owns the model so Chatterbox
+# is never invoked concurrently on one device.
+JOB_QUEUE_SIZE = 16
+JOB_TIMEOUT_SECONDS = 300
+_job_q: "queue.Queue[tuple]" = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+
+
+_VOICE_RE = re.compile(r"\A[A-Za-z0-9]+\Z")
+
 
 def sanitize_voice(voice: str) -> str:
     """Sanitize voice parameter to allow only alphanumeric characters.
@@ -128,11 +308,11 @@ def sanitize_voice(voice: str) -> str:
         raise ValueError("Voice parameter is required")
     
     # Remove .wav suffix if present
-    if voice.lower().endswith(".wav"):
+    if voice[-4:].lower() == ".wav":
         voice = voice[:-4]
     
     # Only allow alphanumeric characters
-    if not re.match(r'^[A-Za-z0-9]+$', voice):
+    if not _VOICE_RE.match(voice):
         raise ValueError("Voice must contain only alphanumeric characters")
     
     return voice
@@ -153,49 +333,149 @@ def sanitize_uuid(uuid_str: str) -> str:
     if not uuid_str:
         raise ValueError("UUID parameter is required")
     
-    # Only allow valid UUID format (hexadecimal with hyphens)
-    if not re.match(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', uuid_str.lower()):
-        raise ValueError("Invalid UUID format")
+    # Parse and re-emit in canonical form (lowercase hexadecimal with hyphens)
+    try:
+        return str(uuid.UUID(uuid_str))
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Invalid UUID format") from None
+
+
+def _voice_prompt_path(voice: str) -> str:
+    return os.path.join("Voices", f"{voice}.wav")
+
+
+def _prefetch_conds() -> None:
+    """Encode every voice in Voices/ so first requests skip prompt loading.
+
+    Must run before the worker and server start: the redirect below swaps the
+    process-wide sys.stdout/sys.stderr, which would swallow the launcher's
+    readiness line if anything else were printing concurrently.
+    """
+    try:
+        names = sorted(os.listdir("Voices"))
+    except FileNotFoundError:
+        return
+    for name in names:
+        try:
+            voice = sanitize_voice(name)
+        except ValueError:
+            continue
+        prompt_path = _voice_prompt_path(voice)
+        try:
+            with contextlib.redirect_stdout(_DEVNULL), contextlib.redirect_stderr(_DEVNULL):
+                _get_conds(prompt_path, os.stat(prompt_path).st_mtime_ns)
+        except Exception as exc:
+            print(f"Failed to prepare voice {voice}: {exc}", file=sys.stderr)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_conds(prompt_path: str, mtime_ns: int):
+    """Encode a voice prompt into Chatterbox conditionals once per file version.
+
+    The mtime is part of the cache key so replacing a file in Voices/ picks up
+    the new recording without a server restart.
+    """
+    if _weight_dtype == torch.float32:
+        tts.prepare_conditionals(prompt_path, exaggeration=EXAGGERATION)
+        return tts.conds
+    # S3Gen.embed_ref feeds the float32 speaker encoder at the flow's dtype,
+    # so encode with the flow temporarily back in float32. The resulting
+    # ref_dict is cast to the flow's dtype on every generate() anyway.
+    flow = tts.s3gen.flow
+    flow.to(dtype=torch.float32)
+    try:
+        tts.prepare_conditionals(prompt_path, exaggeration=EXAGGERATION)
+    finally:
+        flow.to(dtype=_weight_dtype)
+    return tts.conds
+
+
+def _generate(text: str, prompt_path: str, prompt_mtime_ns: int) -> torch.Tensor:
+    """Load the voice conditionals and run Chatterbox inference, falling back
+    step by step on failure.
+
+    A torch.compile error (raised on first use) reverts the compiled modules
+    to eager. Any other RuntimeError before the first successful generation
+    (normally the startup warmup) disables autocast for good and retries in
+    fp32, casting float16 weights back to float32 as well. Once generation
+    has worked, errors are raised as-is instead of degrading the server.
+    """
+    global _use_autocast, _weight_dtype, _generate_succeeded
+    while True:
+        try:
+            tts.conds = _get_conds(prompt_path, prompt_mtime_ns)
+            # Pass the exaggeration stored in the (float32) conds so generate()
+            # sees an exact match and leaves the cached conditionals untouched.
+            exaggeration = float(tts.conds.t3.emotion_adv[0, 0, 0])
+            kwargs = dict(language_id="sv", temperature=0.1, exaggeration=exaggeration, cfg_weight=0.1)
+            if _use_autocast:
+                device_type = "mps" if torch.device(tts.device).type == "mps" else "cpu"
+                with torch.inference_mode(), torch.autocast(device_type=device_type, dtype=_autocast_dtype):
+                    wav = tts.generate(text, **kwargs).float()
+            else:
+                with torch.inference_mode():
+                    wav = tts.generate(text, **kwargs)
+        except RuntimeError as exc:
+            if _compiled_modules and _is_compile_error(exc):
+                print(f"Compiled generation failed, reverting to eager: {exc}", file=sys.stderr)
+                _revert_compiled()
+            elif _use_autocast and not _generate_succeeded:
+                print(f"{_autocast_dtype} autocast failed, falling back to fp32: {exc}", file=sys.stderr)
+                _use_autocast = False
+                if _weight_dtype != torch.float32:
+                    _weight_dtype = torch.float32
+                    _set_weight_dtype(tts, _weight_dtype)
+            else:
+                raise
+        else:
+            _generate_succeeded = True
+            return wav
+
+
+def normalize_text(text: str) -> str:
+    """Validate request text and NFKD-normalize it for the model.
     
-    return uuid_str.lower()
+    Args:
+        text: Raw text from request
+        
+    Returns:
+        Stripped, normalized text
+        
+    Raises:
+        ValueError: If text is empty or too long
+    """
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("Text is empty")
+    if len(text) > MAX_TEXT_CHARS:
+        raise ValueError(f"Text too long (max {MAX_TEXT_CHARS} characters)")
+    # NFKD is a no-op on ASCII, so skip the copy in that case
+    return text if text.isascii() else unicodedata.normalize("NFKD", text)
 
 
-def synthesize_to_file(output_path: str, voice: str, text: str) -> None:
-    """Generate TTS audio and save to file.
+def synthesize(voice: str, text: str) -> torch.Tensor:
+    """Generate TTS audio as a (channels, samples) float waveform.
     
     Args:
-        output_path: Path where WAV file should be saved
         voice: Sanitized voice name (without .wav extension)
         text: Text to synthesize
         
+    Returns:
+        Waveform tensor at tts.sr
+        
     Raises:
-        ValueError: If text is empty after normalization
+        ValueError: If text is empty or too long
         FileNotFoundError: If voice prompt file doesn't exist
     """
-    normalized_text = unicodedata.normalize("NFKD", text or "")
-    if not normalized_text.strip():
-        raise ValueError("Text is empty after normalization")
-
-    prompt_path = os.path.join("Voices", f"{voice}.wav")
-    if not os.path.exists(prompt_path):
-        raise FileNotFoundError(f"Voice prompt not found: {prompt_path}")
-
-    stdout_buf, stderr_buf = io.StringIO(), io.StringIO()
-    with contextlib.redirect_stdout(stdout_buf), contextlib.redirect_stderr(stderr_buf), warnings.catch_warnings():
-        warnings.filterwarnings(
-            "ignore",
-            r"pkg_resources is deprecated.*",
-            category=UserWarning,
-            module=r"perth\.perth_net",
-        )
-        wav = tts.generate(
-            normalized_text,
-            language_id="sv",
-            audio_prompt_path=prompt_path,
-            temperature=0.1,
-            exaggeration=0.1,
-            cfg_weight=0.1,
-        )
+    normalized_text = normalize_text(text)
+
+    prompt_path = _voice_prompt_path(voice)
+    try:
+        prompt_mtime = os.stat(prompt_path).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Voice prompt not found: {prompt_path}") from None
+
+    wav = _generate(normalized_text, prompt_path, prompt_mtime)
 
     # trimmed_wav = _trim_wav(wav, tts.sr)
     # if trimmed_wav.shape[1] == 0:
@@ -204,24 +484,286 @@ def synthesize_to_file(output_path: str, voice: str, text: str) -> None:
     #     original_dur = wav.shape[1] / tts.sr
     #     trimmed_dur = trimmed_wav.shape[1] / tts.sr
     #     print(f"Trimmed WAV from {original_dur:.2f}s to {trimmed_dur:.2f}s", file=sys.stderr)
+    # return trimmed_wav
+
+    return wav
+
+
+def synthesize_to_file(output_path: str, voice: str, text: str) -> torch.Tensor:
+    """Generate TTS audio and save to file.
+    
+    Args:
+        output_path: Path where WAV file should be saved
+        voice: Sanitized voice name (without .wav extension)
+        text: Text to synthesize
+        
+    Returns:
+        The generated waveform, for callers that also stream it
+        
+    Raises:
+        ValueError: If text is empty or too long
+        FileNotFoundError: If voice prompt file doesn't exist
+    """
+    wav = synthesize(voice, text)
 
     directory = os.path.dirname(output_path)
     if directory:
         os.makedirs(directory, exist_ok=True)
-    ta.save(output_path, wav, tts.sr)
-    # ta.save(output_path, trimmed_wav, tts.sr)
+    # Reserve the name exclusively so an existing file can never be clobbered
+    os.close(os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+    try:
+        ta.save(output_path, _to_pcm16(wav).cpu(), tts.sr, encoding="PCM_S", bits_per_sample=16)
+    except BaseException:
+        os.unlink(output_path)
+        raise
+    return wav
+
+
+def _to_pcm16(wav: torch.Tensor) -> torch.Tensor:
+    """Quantize a float waveform in [-1, 1] to int16 on its current device."""
+    return (wav.clamp(-1.0, 1.0) * 32767.0).to(torch.int16)
+
+
+def _wav_header(sample_rate: int, channels: int, num_frames: int) -> bytes:
+    """Build a 44-byte RIFF header for 16-bit PCM data."""
+    block_align = channels * 2
+    data_size = num_frames * block_align
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16,
+        b"data", data_size,
+    )
+
+
+def _render_path(key: str) -> str:
+    return os.path.join(RENDER_CACHE_DIR, f"{key}.wav")
+
+
+def _render_key(voice: str, prompt_mtime_ns: int, text: str) -> str:
+    # The voice file's mtime is part of the key so replacing Voices/<voice>.wav
+    # stops serving audio rendered with the old recording.
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{voice}-{prompt_mtime_ns}-{digest}"
+
+
+def _link_rendered(key: str, output_path: str) -> bool:
+    """Hard-link a cached render to output_path. Returns False on a cache miss."""
+    with _render_lock:
+        if key not in _rendered:
+            return False
+        _rendered.move_to_end(key)
+    try:
+        _link_response(_render_path(key), output_path)
+    except FileNotFoundError:
+        with _render_lock:
+            _rendered.pop(key, None)
+        return False
+    return True
+
+
+def _link_response(render_path: str, output_path: str) -> None:
+    """Hard-link a render to a response path and mark it fresh for the janitor.
+
+    Links share the render's inode, and creating one doesn't touch st_mtime;
+    without the utime a response for an old cached render would be swept
+    almost immediately.
+    """
+    os.link(render_path, output_path)
+    os.utime(output_path)
+
+
+def _open_rendered(key: str):
+    """Open a cached render for reading. Returns None on a cache miss."""
+    with _render_lock:
+        if key not in _rendered:
+            return None
+        _rendered.move_to_end(key)
+    try:
+        return open(_render_path(key), "rb")
+    except FileNotFoundError:
+        with _render_lock:
+            _rendered.pop(key, None)
+        return None
+
+
+def _submit_render(key: str, voice: str, text: str) -> concurrent.futures.Future:
+    """Queue a render into the cache, or join an identical one already in flight.
+    
+    Raises:
+        queue.Full: If a new job is needed and the queue is full
+    """
+    with _render_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        future = concurrent.futures.Future()
+        _job_q.put_nowait((future, _render_path(key), voice, text))
+        _inflight[key] = future
+    future.add_done_callback(functools.partial(_finish_render, key))
+    return future
+
+
+def _finish_render(key: str, future: concurrent.futures.Future) -> None:
+    """Move a completed render from in-flight into the LRU, evicting the oldest."""
+    with _render_lock:
+        _inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        _rendered[key] = _render_path(key)
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _, evicted_path = _rendered.popitem(last=False)
+            try:
+                os.unlink(evicted_path)
+            except OSError:
+                pass
+
+
+def _remove_temp_files(max_age_seconds: float = 0) -> None:
+    """Delete WAV files in TEMP_DIR last modified more than max_age_seconds ago."""
+    cutoff = time.time() - max_age_seconds
+    try:
+        entries = list(os.scandir(TEMP_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not entry.name.endswith(".wav"):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            print(f"Failed to delete file {entry.path}: {exc}", file=sys.stderr)
+
 
+def _janitor() -> None:
+    """Periodically sweep rendered files that no client came back for."""
+    while True:
+        time.sleep(JANITOR_INTERVAL_SECONDS)
+        _remove_temp_files(TEMP_FILE_MAX_AGE_SECONDS)
 
-class TTSServerHandler(BaseHTTPRequestHandler):
-    protocol_version = "HTTP/1.1"
 
-    def do_GET(self):
+def _worker() -> None:
+    """Consume synthesis jobs one at a time and resolve their futures."""
+    torch.set_grad_enabled(False)
+    while True:
+        future, output_path, voice, text = _job_q.get()
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    if output_path is None:
+                        result = synthesize(voice, text)
+                    else:
+                        result = synthesize_to_file(output_path, voice, text)
+                except BaseException as exc:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+        finally:
+            _job_q.task_done()
+
+
+# Fast path for the launcher's /healthz polling
+_HEALTHZ_RESPONSE = b"HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n\r\n"
+
+# Upper bound on request line + headers
+MAX_HEADER_BYTES = 64 * 1024
+
+# Upper bound on a POST body; MAX_TEXT_CHARS of text fits comfortably
+MAX_BODY_BYTES = 64 * 1024
+
+
+@functools.lru_cache(maxsize=64)
+def _error_bytes(message: str) -> bytes:
+    """Encode an error body once per distinct message."""
+    return json.dumps({"error": message}).encode("utf-8")
+
+
+class TTSServerHandler:
+    """Serve HTTP/1.1 requests on one keep-alive connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.method = ""
+        self.path = ""
+        self.headers: "dict[str, str]" = {}
+        self.close_connection = False
+
+    async def handle(self) -> None:
+        try:
+            while await self.handle_one_request():
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writer.close()
+
+    async def handle_one_request(self) -> bool:
+        """Handle a single request; returns whether the connection stays open."""
+        try:
+            head = await self.reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return False
+        except asyncio.LimitOverrunError:
+            self.close_connection = True
+            await self.send_error(431, "Request header fields too large")
+            return False
+
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+            self.close_connection = True
+            await self.send_error(400, "Bad request syntax")
+            return False
+        self.method, self.path, version = parts
+
+        self.headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                self.headers[name.strip().lower()] = value.strip()
+
+        connection = self.headers.get("connection", "").lower()
+        if version == "HTTP/1.1":
+            self.close_connection = connection == "close"
+        else:
+            self.close_connection = connection != "keep-alive"
+
+        if self.method == "GET":
+            await self.do_GET()
+        elif self.method == "POST":
+            await self.do_POST()
+        else:
+            self.close_connection = True
+            await self.send_error(501, f"Unsupported method ({self.method})")
+        return not self.close_connection
+
+    async def send_response(self, status: int, headers: "dict[str, str]", body: bytes = b"") -> None:
+        """Write a status line, headers and an optional body."""
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        if self.close_connection:
+            lines.append("Connection: close")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+    async def send_error(self, status: int, message: str) -> None:
+        print(f"{self.method} {self.path} -> {status}: {message}", file=sys.stderr)
+        body = _error_bytes(message)
+        await self.send_response(
+            status,
+            {"Content-Type": "application/json", "Content-Length": str(len(body))},
+            body,
+        )
+
+    async def do_GET(self):
         # Health check endpoint used by the macOS launcher; avoids noisy 404 logs.
         if self.path.rstrip("/") == "/healthz":
-            self.send_response(204)
-            self.send_header("Content-Length", "0")
-            self.send_header("Connection", "close")
-            self.end_headers()
+            self.writer.write(_HEALTHZ_RESPONSE)
+            await self.writer.drain()
             return
 
         # Extract UUID from path (e.g., /uuid or /uuid.wav)
@@ -232,116 +774,217 @@ class TTSServerHandler(BaseHTTPRequestHandler):
             path = path[:-4]
         
         if not path:
-            self.send_error(404, "Not Found")
+            await self.send_error(404, "Not Found")
             return
         
         try:
             uuid_str = sanitize_uuid(path)
         except ValueError as exc:
-            self.send_error(400, str(exc))
+            await self.send_error(400, str(exc))
             return
         
-        # Check if file exists
+        # Open file; a missing file is a 404
         file_path = os.path.join(TEMP_DIR, f"{uuid_str}.wav")
-        if not os.path.exists(file_path):
-            self.send_error(404, "File not found")
-            return
-        
-        # Read file
         try:
-            with open(file_path, "rb") as f:
-                file_data = f.read()
+            f = open(file_path, "rb")
+        except FileNotFoundError:
+            await self.send_error(404, "File not found")
+            return
         except Exception as exc:
             print(f"Failed to read file {file_path}: {exc}", file=sys.stderr)
-            self.send_error(500, "Failed to read file")
+            await self.send_error(500, "Failed to read file")
             return
         
-        # Send file
-        self.send_response(200)
-        self.send_header("Content-Type", "audio/wav")
-        self.send_header("Content-Length", str(len(file_data)))
-        self.send_header("Connection", "close")
-        self.end_headers()
-        self.wfile.write(file_data)
-        self.wfile.flush()
+        if not await self._send_file(f):
+            return
         
         # Delete file after successful transfer
         try:
-            os.remove(file_path)
+            os.unlink(file_path)
         except Exception as exc:
             print(f"Failed to delete file {file_path}: {exc}", file=sys.stderr)
 
-    def do_POST(self):
-        content_length = self.headers.get("Content-Length")
+    async def do_POST(self):
+        content_length = self.headers.get("content-length")
         if content_length is None:
-            self.send_error(411, "Content-Length header required")
+            self.close_connection = True
+            await self.send_error(411, "Content-Length header required")
             return
 
         try:
             length = int(content_length)
         except ValueError:
-            self.send_error(400, "Invalid Content-Length header")
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            await self.send_error(400, "Invalid Content-Length header")
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            await self.send_error(413, "Request body too large")
             return
 
-        body = self.rfile.read(length)
+        # Clients such as curl hold back larger bodies until told to go ahead
+        if self.headers.get("expect", "").lower() == "100-continue":
+            self.writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await self.writer.drain()
+
+        body = await self.reader.readexactly(length)
         try:
             payload = json.loads(body.decode("utf-8"))
-        except json.JSONDecodeError:
-            self.send_error(400, "Invalid JSON payload")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            await self.send_error(400, "Invalid JSON payload")
             return
 
         # Extract and validate parameters
-        voice = payload.get("voice")
-        text = payload.get("text")
+        voice = payload.get("voice") if isinstance(payload, dict) else None
+        text = payload.get("text") if isinstance(payload, dict) else None
         
         if not voice or text is None:
-            self.send_error(400, "Payload must include voice and text")
+            await self.send_error(400, "Payload must include voice and text")
+            return
+        if not isinstance(voice, str) or not isinstance(text, str):
+            await self.send_error(400, "Voice and text must be strings")
             return
         
-        # Sanitize voice parameter
+        # Sanitize voice and text parameters
         try:
             sanitized_voice = sanitize_voice(voice)
+            normalized_text = normalize_text(text)
         except ValueError as exc:
-            self.send_error(400, str(exc))
+            await self.send_error(400, str(exc))
             return
         
+        # ?wait=1 returns the audio in the response body instead of a UUID
+        query = parse_qs(urlsplit(self.path).query)
+        wait = query.get("wait", ["0"])[0] == "1"
+
         # Generate UUID for output file
         file_uuid = str(uuid.uuid4())
         output_path = os.path.join(TEMP_DIR, f"{file_uuid}.wav")
+        prompt_path = _voice_prompt_path(sanitized_voice)
+        try:
+            prompt_mtime = os.stat(prompt_path).st_mtime_ns
+        except FileNotFoundError:
+            await self.send_error(400, f"Voice prompt not found: {prompt_path}")
+            return
+        render_key = _render_key(sanitized_voice, prompt_mtime, normalized_text)
+
+        if wait:
+            f = _open_rendered(render_key)
+            if f is not None:
+                await self._send_file(f)
+                return
+        elif _link_rendered(render_key, output_path):
+            await self._send_uuid(file_uuid)
+            return
+
+        try:
+            future = _submit_render(render_key, sanitized_voice, normalized_text)
+        except queue.Full:
+            await self.send_error(503, "TTS queue is full")
+            return
 
         try:
-            synthesize_to_file(output_path, sanitized_voice, text)
+            # Shield so a timeout here doesn't cancel a render other requests share
+            wav = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), JOB_TIMEOUT_SECONDS)
+            if not wait:
+                _link_response(_render_path(render_key), output_path)
+        except asyncio.TimeoutError:
+            await self.send_error(504, "TTS generation timed out")
+            return
         except FileNotFoundError as exc:
-            self.send_error(400, str(exc))
+            await self.send_error(400, str(exc))
             return
         except ValueError as exc:
-            self.send_error(400, str(exc))
+            await self.send_error(400, str(exc))
             return
         except Exception as exc:
             print(f"TTS generation failed: {exc}", file=sys.stderr)
-            self.send_error(500, "TTS generation failed")
+            await self.send_error(500, "TTS generation failed")
             return
 
-        # Return UUID in JSON response
-        response_data = {"uuid": file_uuid}
-        response_body = json.dumps(response_data).encode("utf-8")
+        if wait:
+            await self._send_wav(wav)
+        else:
+            await self._send_uuid(file_uuid)
+
+    async def _send_file(self, f) -> bool:
+        """Send an open WAV file and close it; returns False if it couldn't be sent."""
+        # Let the kernel copy it straight to the socket (asyncio falls back to
+        # chunked reads where sendfile is unavailable)
+        with f:
+            try:
+                file_size = os.fstat(f.fileno()).st_size
+            except Exception as exc:
+                print(f"Failed to read file {f.name}: {exc}", file=sys.stderr)
+                await self.send_error(500, "Failed to read file")
+                return False
+            await self.send_response(200, {"Content-Type": "audio/wav", "Content-Length": str(file_size)})
+            await asyncio.get_running_loop().sendfile(self.writer.transport, f)
+        return True
+
+    async def _send_uuid(self, file_uuid: str) -> None:
+        """Return the UUID of a rendered file in a JSON response."""
+        # file_uuid comes from uuid.uuid4(), so it never needs JSON escaping
+        response_body = f'{{"uuid":"{file_uuid}"}}'.encode("ascii")
         
-        self.send_response(200)
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Content-Length", str(len(response_body)))
-        self.send_header("Connection", "close")
-        self.end_headers()
-        self.wfile.write(response_body)
-        self.wfile.flush()
+        await self.send_response(
+            200,
+            {"Content-Type": "application/json", "Content-Length": str(len(response_body))},
+            response_body,
+        )
+
+    async def _send_wav(self, wav: torch.Tensor) -> None:
+        """Stream a waveform as 16-bit PCM WAV directly to the client."""
+        pcm = _to_pcm16(wav).t().contiguous().cpu()
+        channels = pcm.shape[1]
+        header = _wav_header(tts.sr, channels, pcm.shape[0])
+        data = memoryview(pcm.numpy()).cast("B")
+
+        await self.send_response(
+            200,
+            {"Content-Type": "audio/wav", "Content-Length": str(len(header) + len(data))},
+            header,
+        )
+        chunk = 64 * 1024
+        for offset in range(0, len(data), chunk):
+            self.writer.write(data[offset : offset + chunk])
+            await self.writer.drain()
+
+
+async def _serve() -> None:
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await TTSServerHandler(reader, writer).handle()
+
+    server = await asyncio.start_server(on_connect, "127.0.0.1", 8080, limit=MAX_HEADER_BYTES)
+    print("TTS server listening on http://127.0.0.1:8080", flush=True)
+    async with server:
+        await server.serve_forever()
 
 
 def main():
     # Ensure temp directory exists
     os.makedirs(TEMP_DIR, exist_ok=True)
     
-    server = HTTPServer(("127.0.0.1", 8080), TTSServerHandler)
-    print("TTS server listening on http://127.0.0.1:8080", flush=True)
-    server.serve_forever()
+    shutil.rmtree(RENDER_CACHE_DIR, ignore_errors=True)
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    atexit.register(_remove_temp_files)
+    atexit.register(shutil.rmtree, RENDER_CACHE_DIR, True)
+    _prefetch_conds()
+    threading.Thread(target=_janitor, name="tts-janitor", daemon=True).start()
+    threading.Thread(target=_worker, name="tts-worker", daemon=True).start()
+    if USE_COMPILE:
+        # Trigger tracing on the worker before real requests arrive; requests
+        # that come in meanwhile simply queue behind the warmup.
+        warmup = concurrent.futures.Future()
+        warmup.add_done_callback(_log_warmup_failure)
+        _job_q.put_nowait((warmup, None, WARMUP_VOICE, "hej"))
+
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":